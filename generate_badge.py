@@ -1,21 +1,82 @@
 # generate_badge.py
+# yaml, requests, jwt, cryptography and concurrent.futures are imported where they are used, keeping
+# start-up (and --help / argument errors) free of their import cost.
 import os
 import sys
-import json
-import yaml
 import hashlib
 import uuid
-import argparse
-import requests
-import tempfile
-from datetime import datetime, timezone
+import calendar
+import functools
+import csv
+import io
+import secrets
+import shutil
+import struct
+import time
+import types
+import zlib
 from urllib.parse import urlparse
-import jwt
-import png
+import orjson
 
-def get_utc_now_iso():
-    """Returns the current UTC time in the required ISO 8601 format."""
-    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+USAGE = """\
+usage: generate_badge.py (--badge_id BADGE_ID --recipient_email RECIPIENT_EMAIL | --batch BATCH) [--output_dir OUTPUT_DIR] [--INPUT VALUE ...]
+
+Generate an Open Badge 3.0.
+
+options:
+  -h, --help            show this help message and exit
+  --badge_id BADGE_ID   The ID of the badge to generate.
+  --recipient_email RECIPIENT_EMAIL
+                        The recipient's email address.
+  --output_dir OUTPUT_DIR
+                        The directory to save the output badge.
+  --batch BATCH         A CSV (with header) or JSON list of records with badge_id, recipient_email and optional inputs.
+  --INPUT VALUE         Any other badge input (e.g. --expires, --startDate), taken as a string.
+"""
+
+ISO_8601_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+BADGE_CONFIG_PATH = 'badges.yml'
+# Resolved JSON copy of badges.yml, keyed by its stat signature, written by update_workflow.py;
+# much faster to parse than YAML.
+CONFIG_CACHE_PATH = '.badges.yml.json'
+# Recipient-independent credential templates per badge, also written by update_workflow.py.
+CREDENTIAL_CACHE_DIR = '.assertion-cache'
+# Directories update_workflow.py publishes issuer and achievement files to, relative to the repository
+# root; the public ids built below use the same paths under repository_url.
+ISSUER_OUTPUT_DIR = 'public'
+ACHIEVEMENT_OUTPUT_DIR = f"{ISSUER_OUTPUT_DIR}/badges"
+OB3_CONTEXT = [
+    "https://www.w3.org/ns/credentials/v2",
+    "https://purl.imsglobal.org/spec/ob/v3p0/context.json"
+]
+# JWS algorithms an issuer may select with `algorithm` in badges.yml; RS256 is the default.
+SUPPORTED_ALGORITHMS = ('RS256', 'EdDSA')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Signature plus the complete IHDR chunk, which the PNG spec requires to come first.
+PNG_HEADER_SIZE = 8 + 4 + 4 + 13 + 4
+# CRC-32 state after the iTXt chunk type; chunk CRCs continue from it over the chunk data.
+ITXT_TYPE_CRC = zlib.crc32(b'iTXt')
+IMAGE_CACHE_DIR = '.image_cache'
+# Cached images younger than this (in seconds) are used without contacting the server.
+IMAGE_CACHE_TTL = 24 * 60 * 60
+
+# Per-process state for batch workers, filled in once by _init_batch_worker.
+_WORKER_STATE = {}
+
+@functools.lru_cache(maxsize=1)
+def format_utc_timestamp(timestamp):
+    """Formats a Unix timestamp in the required ISO 8601 format; repeated calls within a second are cached."""
+    return time.strftime(ISO_8601_FORMAT, time.gmtime(timestamp))
+
+def get_utc_now():
+    """Returns the current UTC time as an (ISO 8601 string, Unix timestamp) pair."""
+    timestamp = int(time.time())
+    return format_utc_timestamp(timestamp), timestamp
+
+@functools.lru_cache(maxsize=128)
+def parse_utc_timestamp(value):
+    """Converts a UTC time in the required ISO 8601 format to a Unix timestamp."""
+    return calendar.timegm(time.strptime(value, ISO_8601_FORMAT))
 
 def get_private_key(secret_name):
     """Retrieves a specific private key directly from an environment variable."""
@@ -25,14 +86,179 @@ def get_private_key(secret_name):
         sys.exit(1)
     return key
 
-def bake_jws_into_png(image_path, jws_string, output_path):
+@functools.lru_cache(maxsize=None)
+def load_signing_key(private_key_pem):
+    """Parses a PEM private key once per process; repeated signatures reuse the key object."""
+    from cryptography.hazmat.primitives import serialization
+    try:
+        return serialization.load_pem_private_key(private_key_pem.encode('utf-8'), password=None)
+    except (ValueError, TypeError) as e:
+        print(f"Error: Could not load private key: {e}")
+        sys.exit(1)
+
+def check_key_algorithm(signing_key, algorithm, issuer_id):
+    """Exits with an error if an issuer's private key cannot sign with its configured algorithm."""
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+    key_type, key_name = {
+        'RS256': (rsa.RSAPrivateKey, 'an RSA'),
+        'EdDSA': (ed25519.Ed25519PrivateKey, 'an Ed25519'),
+    }[algorithm]
+    if not isinstance(signing_key, key_type):
+        print(f"Error: Issuer '{issuer_id}' uses {algorithm}, which needs {key_name} private key.")
+        sys.exit(1)
+
+def get_recipient_salt():
+    """Retrieves the recipient hashing salt from the environment, encoded once as bytes."""
+    recipient_salt = os.environ.get('RECIPIENT_SALT')
+    if not recipient_salt:
+        print("Error: RECIPIENT_SALT not found in secrets.")
+        sys.exit(1)
+    return recipient_salt.encode('utf-8')
+
+def resolve_templates(value, repo_url):
+    """Recursively substitutes {repository_url} into every string of a config value."""
+    if isinstance(value, str):
+        return value.replace('{repository_url}', repo_url)
+    if isinstance(value, dict):
+        return {key: resolve_templates(item, repo_url) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_templates(item, repo_url) for item in value]
+    return value
+
+def config_signature(path):
+    """Returns the [mtime_ns, size, inode] stat signature of a config file, which keys the local caches."""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+def dump_signed_cache(path, signature, data):
+    """Serializes cache data together with the config path and signature it was derived from."""
+    return orjson.dumps({'path': path, 'sig': signature, 'data': data})
+
+def load_signed_cache(cache_path, path, signature):
+    """Returns the data of a cache file written for this config path and signature, otherwise None."""
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = orjson.loads(f.read())
+        if cached.get('path') == path and cached.get('sig') == signature:
+            return cached['data']
+    except (OSError, ValueError, AttributeError, KeyError):
+        # Missing, unreadable, malformed or stale cache; the caller rebuilds from the config.
+        pass
+    return None
+
+def load_config():
+    """
+    Loads badges.yml with every {repository_url} placeholder already substituted.
+    The pre-resolved JSON cache is used while badges.yml's stat signature is unchanged.
+    """
+    config = load_signed_cache(CONFIG_CACHE_PATH, BADGE_CONFIG_PATH, config_signature(BADGE_CONFIG_PATH))
+    if config is not None:
+        return config
+    import yaml
+    # Prefer the libyaml-backed loader when PyYAML was built with it.
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+    with open(BADGE_CONFIG_PATH, 'rb') as f:
+        config = yaml.load(f.read(), Loader=SafeLoader)
+    return resolve_templates(config, config['repository_url'])
+
+def write_file_atomic(path, data, durable=False):
+    """
+    Writes bytes to a temporary file and renames it over the target path.
+    With durable=True the data is fsynced before the rename, so a crash cannot leave an empty file behind.
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def write_if_changed(path, data, durable=False):
+    """Atomically replaces path with data unless it already holds exactly those bytes. Returns True if written."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    write_file_atomic(path, data, durable)
+    return True
+
+@functools.lru_cache(maxsize=None)
+def get_session():
+    """Returns a shared session so repeated image downloads reuse pooled keep-alive connections."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
+
+def fetch_image(image_url):
     """
-    Bakes a JWS string into a PNG image file by adding an iTXt chunk.
+    Returns the badge image bytes, using an on-disk cache keyed by URL.
+    Stale entries are revalidated with If-None-Match / If-Modified-Since.
     """
+    cache_key = hashlib.sha1(image_url.encode('utf-8')).hexdigest()
+    image_path = os.path.join(IMAGE_CACHE_DIR, f"{cache_key}.png")
+    meta_path = os.path.join(IMAGE_CACHE_DIR, f"{cache_key}.json")
+
+    headers = {}
+    try:
+        if time.time() - os.stat(image_path).st_mtime < IMAGE_CACHE_TTL:
+            with open(image_path, 'rb') as f:
+                print(f"Using cached badge image for {image_url}")
+                return f.read()
+        with open(meta_path, 'rb') as f:
+            meta = orjson.loads(f.read())
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    except (OSError, ValueError):
+        # Nothing usable cached yet; do a plain download.
+        pass
+
+    import requests
     try:
-        # The reader is used as an iterator and does not need to be manually closed.
-        reader = png.Reader(filename=image_path)
-        chunks = list(reader.chunks())
+        response = get_session().get(image_url, headers=headers, timeout=10)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching badge image from {image_url}: {e}")
+        sys.exit(1)
+
+    if response.status_code == 304:
+        # Unchanged upstream; restart the TTL and serve the cached copy.
+        os.utime(image_path)
+        with open(image_path, 'rb') as f:
+            print(f"Revalidated cached badge image for {image_url}")
+            return f.read()
+
+    image_bytes = response.content
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        write_file_atomic(image_path, image_bytes)
+        write_file_atomic(meta_path, orjson.dumps({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }))
+    except OSError as e:
+        print(f"Warning: could not cache badge image: {e}")
+    return image_bytes
+
+def bake_jws_into_png(image_file, jws_string, output_path):
+    """
+    Bakes a JWS string into a PNG image, read from a file-like object, by adding an iTXt chunk.
+    The chunk is spliced in after IHDR at the byte level; the image data is copied through undecoded.
+    """
+    try:
+        # PNG signature followed by the IHDR chunk: length (4) + type (4) + data (13) + CRC (4).
+        header = image_file.read(PNG_HEADER_SIZE)
+        if len(header) != PNG_HEADER_SIZE or header[:8] != PNG_SIGNATURE or header[8:16] != b'\x00\x00\x00\x0dIHDR':
+            raise ValueError("image is not a PNG file starting with an IHDR chunk")
 
         # Keyword must be 'openbadgecredential'.
         # The spec recommends no compression (flag=0, method=0), an empty language tag, and an empty translated keyword.
@@ -51,89 +277,163 @@ def bake_jws_into_png(image_path, jws_string, output_path):
             translated_keyword + null_separator +
             text
         )
-        # The pypng library expects a tuple of (chunk_type_bytes, chunk_data_bytes)
-        chunk_to_add = (b'iTXt', itxt_chunk_data)
-
-        # Insert the chunk after the IHDR chunk.
-        chunks.insert(1, chunk_to_add)
+        # A chunk is its data length, type, data, and a CRC-32 over type + data.
+        itxt_chunk = (
+            struct.pack('>I', len(itxt_chunk_data)) + b'iTXt' + itxt_chunk_data +
+            struct.pack('>I', zlib.crc32(itxt_chunk_data, ITXT_TYPE_CRC))
+        )
 
+        # Insert the chunk after the IHDR chunk and stream the rest of the file unchanged.
         with open(output_path, 'wb') as f:
-            png.write_chunks(f, chunks)
+            f.write(header)
+            f.write(itxt_chunk)
+            shutil.copyfileobj(image_file, f)
         print("Baking successful.")
     except Exception as e:
         print(f"Error baking JWS into PNG: {e}")
         sys.exit(1)
 
-def generate_badge(args):
-    print(f"--- Starting badge generation for ID: {args.badge_id} ---")
-    with open('badges.yml', 'r') as f:
-        config = yaml.safe_load(f)
+def load_batch_records(batch_path):
+    """Reads batch records from a CSV file with a header row or a JSON list of objects."""
+    with open(batch_path, 'rb') as f:
+        data = f.read()
+    if batch_path.lower().endswith('.csv'):
+        records = list(csv.DictReader(io.StringIO(data.decode('utf-8-sig'))))
+    else:
+        records = orjson.loads(data)
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            print(f"Error: Batch file '{batch_path}' must contain a JSON list of objects.")
+            sys.exit(1)
 
-    badge_config = config['badges'].get(args.badge_id)
-    if not badge_config:
-        print(f"Error: Badge ID '{args.badge_id}' not found in badges.yml.")
-        sys.exit(1)
+    for index, record in enumerate(records, 1):
+        for key in ('badge_id', 'recipient_email'):
+            if not isinstance(record.get(key), str) or not record[key]:
+                print(f"Error: Batch record {index} needs a non-empty string '{key}'.")
+                sys.exit(1)
+    return records
 
-    issuer_id = badge_config['issuer_id']
-    issuer_config = config['issuers'][issuer_id]
-    private_key = get_private_key(issuer_config['private_key_secret_name'])
-    recipient_salt = os.environ.get('RECIPIENT_SALT')
-    if not recipient_salt:
-        print("Error: RECIPIENT_SALT not found in secrets.")
-        sys.exit(1)
-    repo_url = config['repository_url']
-
-    # 1. Create Issuer Profile
-    issuer_profile = json.loads(json.dumps(issuer_config))
+def build_issuer_profile(config, issuer_id):
+    """Builds the public issuer profile, as published and embedded in credentials, from the resolved config."""
+    # Config strings arrive with {repository_url} already substituted (see resolve_templates).
+    issuer_profile = {
+        key: value for key, value in config['issuers'][issuer_id].items()
+        if key not in ('private_key_secret_name', 'algorithm')
+    }
     issuer_filename = f"{issuer_id}-issuer.json"
-    issuer_profile['id'] = f"{repo_url}/public/{issuer_filename}"
-    for key, value in issuer_profile.items():
-        if isinstance(value, str):
-            issuer_profile[key] = value.format(repository_url=repo_url)
-    issuer_profile.pop('private_key_secret_name', None)
+    issuer_profile['id'] = f"{config['repository_url']}/{ISSUER_OUTPUT_DIR}/{issuer_filename}"
     issuer_profile['type'] = 'Profile'
+    return issuer_profile
 
-    # 2. Create Achievement
-    achievement = {
-        "id": f"{repo_url}/public/badges/{args.badge_id}.json",
+def build_achievement(config, badge_id):
+    """Builds a badge's OB 3.0 Achievement, as published and embedded in credentials, from the resolved config."""
+    badge_config = config['badges'][badge_id]
+    return {
+        "id": f"{config['repository_url']}/{ACHIEVEMENT_OUTPUT_DIR}/{badge_id}.json",
         "type": "Achievement",
         "name": badge_config['name'],
         "description": badge_config['description'],
         "criteria": { "narrative": badge_config['criteria'] },
         "image": {
-            "id": badge_config['image'].format(repository_url=repo_url),
+            "id": badge_config['image'],
             "type": "Image"
         }
     }
 
+def build_credential_template(config, badge_id):
+    """
+    Builds the recipient-independent part of a badge's credential (contexts, types, issuer, achievement)
+    from the resolved config. update_workflow.py caches its output with this same function.
+    """
+    return {
+        "@context": OB3_CONTEXT,
+        "type": ["VerifiableCredential", "OpenBadgeCredential"],
+        "issuer": build_issuer_profile(config, config['badges'][badge_id]['issuer_id']),
+        "credentialSubject": {
+            "type": "AchievementSubject",
+            "achievement": build_achievement(config, badge_id)
+        }
+    }
+
+def load_credential_template(config, badge_id):
+    """Returns a badge's credential template, from update_workflow.py's cache when it is current."""
+    credential = load_signed_cache(
+        os.path.join(CREDENTIAL_CACHE_DIR, f"{badge_id}.json"), BADGE_CONFIG_PATH, config_signature(BADGE_CONFIG_PATH)
+    )
+    if credential is not None:
+        return credential
+    return build_credential_template(config, badge_id)
+
+def prepare_badge(config, badge_id):
+    """
+    Builds the recipient-independent parts of a badge: credential template, signing key and image.
+    The badge ID must already have passed preflight.
+    """
+    issuer_id = config['badges'][badge_id]['issuer_id']
+    issuer_config = config['issuers'][issuer_id]
+    private_key_pem = get_private_key(issuer_config['private_key_secret_name'])
+    algorithm = issuer_config.get('algorithm', 'RS256')
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        print(f"Error: Unsupported algorithm '{algorithm}' for issuer '{issuer_id}'. Use one of: {', '.join(SUPPORTED_ALGORITHMS)}.")
+        sys.exit(1)
+    check_key_algorithm(load_signing_key(private_key_pem), algorithm, issuer_id)
+
+    credential = load_credential_template(config, badge_id)
+    return {
+        'credential': credential,
+        # PEM text rather than a key object, so templates can be pickled to batch workers.
+        'private_key_pem': private_key_pem,
+        'algorithm': algorithm,
+        'image_bytes': fetch_image(credential['credentialSubject']['achievement']['image']['id'])
+    }
+
+def sign_credential(jwt_payload, signing_key, algorithm="RS256"):
+    """
+    Signs a VC-JWT payload with an already-parsed private key and returns the compact JWS string.
+    `algorithm` is RS256 for RSA keys or EdDSA for Ed25519 keys.
+    """
+    headers = {
+        "alg": algorithm,
+        "typ": "vc+ld+jwt" # As per VC-JWT spec
+    }
+    import jwt
+    # orjson emits the compact UTF-8 payload bytes that the JWS layer signs directly.
+    return jwt.api_jws.encode(orjson.dumps(jwt_payload), signing_key, algorithm=algorithm, headers=headers)
+
+def issue_badge(badge, record, salt_bytes, output_dir):
+    """
+    Issues a badge to a single recipient using a template from prepare_badge.
+    `record` holds badge_id, recipient_email and any optional inputs (expires, startDate).
+    """
     # 3. Create Recipient Identifier
-    identity_hash = hashlib.sha256(f'{args.recipient_email}{recipient_salt}'.encode('utf-8')).hexdigest()
+    identity_digest = hashlib.sha256(record['recipient_email'].encode('utf-8'))
+    identity_digest.update(salt_bytes)
+    identity_hash = identity_digest.hexdigest()
     # Per OB 3.0, recipient identifier should be a URI. Using a URN with the hash.
     recipient_id = f"urn:sha256:{identity_hash}"
 
     # 4. Construct the Verifiable Credential
     credential_id = f"urn:uuid:{uuid.uuid4()}"
+    # Format and timestamp come from one clock read, so nbf needs no strptime round-trip.
+    valid_from, not_before = get_utc_now()
+    # Only the recipient-specific fields are filled in; the rest comes from the credential template.
+    template = badge['credential']
     vc = {
-        "@context": [
-            "https://www.w3.org/ns/credentials/v2",
-            "https://purl.imsglobal.org/spec/ob/v3p0/context.json"
-        ],
+        "@context": template['@context'],
         "id": credential_id,
-        "type": ["VerifiableCredential", "OpenBadgeCredential"],
-        "issuer": issuer_profile,
-        "validFrom": get_utc_now_iso(),
+        "type": template['type'],
+        "issuer": template['issuer'],
+        "validFrom": valid_from,
         "credentialSubject": {
             "id": recipient_id,
-            "type": "AchievementSubject",
-            "achievement": achievement
+            **template['credentialSubject']
         }
     }
     
     # Handle optional inputs
-    if getattr(args, 'expires', None):
-        vc['validUntil'] = args.expires
-    if getattr(args, 'startDate', None):
-        vc['credentialSubject']['activityStartDate'] = args.startDate
+    if record.get('expires'):
+        vc['validUntil'] = record['expires']
+    if record.get('startDate'):
+        vc['credentialSubject']['activityStartDate'] = record['startDate']
 
     # 5. Create JWS
     jwt_payload = vc.copy()
@@ -142,52 +442,115 @@ def generate_badge(args):
         'iss': vc['issuer']['id'],
         'sub': vc['credentialSubject']['id'],
         'jti': vc['id'],
-        'nbf': int(datetime.strptime(vc['validFrom'], '%Y-%m-%dT%H:%M:%SZ').timestamp())
+        'nbf': not_before
     })
     if 'validUntil' in vc:
-        jwt_payload['exp'] = int(datetime.strptime(vc['validUntil'], '%Y-%m-%dT%H:%M:%SZ').timestamp())
+        jwt_payload['exp'] = parse_utc_timestamp(vc['validUntil'])
     
-    headers = {
-        "alg": "RS256",
-        "typ": "vc+ld+jwt" # As per VC-JWT spec
-    }
-    encoded_jws = jwt.encode(jwt_payload, private_key, algorithm="RS256", headers=headers)
+    encoded_jws = sign_credential(jwt_payload, load_signing_key(badge['private_key_pem']), badge['algorithm'])
 
     # 6. Bake into PNG
-    output_path = os.path.join(args.output_dir, f"{args.badge_id}-{uuid.uuid4()}.png")
+    # The filename only needs a collision-resistant suffix, not a UUID object.
+    output_path = os.path.join(output_dir, f"{record['badge_id']}-{secrets.token_hex(16)}.png")
     print(f"Baking badge to: {output_path}")
 
-    image_url = achievement['image']['id']
-    try:
-        response = requests.get(image_url, stream=True)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching badge image from {image_url}: {e}")
-        sys.exit(1)
+    # Keep the image in memory rather than round-tripping it through a temp file.
+    bake_jws_into_png(io.BytesIO(badge['image_bytes']), encoded_jws, output_path)
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_image:
-        for chunk in response.iter_content(chunk_size=8192):
-            temp_image.write(chunk)
-        temp_image_path = temp_image.name
+    print("--- Badge generated successfully! ---")
+    return output_path
 
-    bake_jws_into_png(temp_image_path, encoded_jws, output_path)
+def usage_error(message):
+    """Prints the usage line and an error message to stderr, then exits with status 2."""
+    sys.stderr.write(f"{USAGE.splitlines()[0]}\ngenerate_badge.py: error: {message}\n")
+    sys.exit(2)
 
-    os.remove(temp_image_path)
-    print("--- Badge generated successfully! ---")
+def parse_args(argv):
+    """
+    Parses `--key value` and `--key=value` pairs in a single pass.
+    Every flag is accepted and kept as a string, so any badge input can be passed through.
+    Dashes in keys become underscores, as argparse does, so --output-dir sets output_dir.
+    """
+    args = types.SimpleNamespace(badge_id=None, recipient_email=None, output_dir='.', batch=None)
+    index = 0
+    while index < len(argv):
+        arg = argv[index]
+        index += 1
+        if arg in ('-h', '--help'):
+            print(USAGE, end='')
+            sys.exit(0)
+        key, has_value, value = arg[2:].partition('=')
+        if not arg.startswith('--') or not key:
+            usage_error(f"unrecognized argument: {arg}")
+        if not has_value:
+            if index >= len(argv) or argv[index].startswith('--'):
+                usage_error(f"argument --{key}: expected one argument")
+            value = argv[index]
+            index += 1
+        setattr(args, key.replace('-', '_'), value)
+    return args
+
+def preflight(config, badge_ids):
+    """Checks that each badge exists and its issuer's key secret is set before any download or signing."""
+    for badge_id in badge_ids:
+        badge_config = config['badges'].get(badge_id)
+        if not badge_config:
+            print(f"Error: Badge ID '{badge_id}' not found in badges.yml.")
+            sys.exit(1)
+        get_private_key(config['issuers'][badge_config['issuer_id']]['private_key_secret_name'])
+
+def generate_badge(args):
+    print(f"--- Starting badge generation for ID: {args.badge_id} ---")
+    salt_bytes = get_recipient_salt()
+    config = load_config()
+    preflight(config, [args.badge_id])
+    badge = prepare_badge(config, args.badge_id)
+    issue_badge(badge, vars(args), salt_bytes, args.output_dir)
+
+def _init_batch_worker(badges, salt_bytes, output_dir):
+    """Receives the shared batch inputs once per worker process and parses each signing key up front."""
+    _WORKER_STATE.update(badges=badges, salt_bytes=salt_bytes, output_dir=output_dir)
+    for badge in badges.values():
+        load_signing_key(badge['private_key_pem'])
+
+def _issue_batch_record(record):
+    state = _WORKER_STATE
+    return issue_badge(state['badges'][record['badge_id']], record, state['salt_bytes'], state['output_dir'])
+
+def generate_batch(args):
+    """
+    Issues every record in a batch file, loading the config and each badge template only once.
+    Signing and baking are CPU-bound, so records are spread across worker processes.
+    """
+    salt_bytes = get_recipient_salt()
+    records = load_batch_records(args.batch)
+    print(f"--- Starting batch generation of {len(records)} badge(s) from {args.batch} ---")
+    config = load_config()
+    # dict.fromkeys keeps the first-seen order of the distinct badge IDs.
+    badge_ids = list(dict.fromkeys(record['badge_id'] for record in records))
+    preflight(config, badge_ids)
+
+    badges = {badge_id: prepare_badge(config, badge_id) for badge_id in badge_ids}
+
+    max_workers = min(os.cpu_count() or 1, len(records))
+    if max_workers <= 1:
+        for record in records:
+            issue_badge(badges[record['badge_id']], record, salt_bytes, args.output_dir)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_batch_worker,
+            initargs=(badges, salt_bytes, args.output_dir)
+        ) as executor:
+            list(executor.map(_issue_batch_record, records))
+    print(f"--- Batch finished: {len(records)} badge(s) generated. ---")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Generate an Open Badge 3.0.", add_help=True)
-    # Known arguments
-    parser.add_argument('--badge_id', type=str, required=True, help="The ID of the badge to generate.")
-    parser.add_argument('--recipient_email', type=str, required=True, help="The recipient's email address.")
-    parser.add_argument('--output_dir', type=str, default='.', help="The directory to save the output badge.")
-
-    # Dynamically add other arguments based on what's passed
-    known_args, unknown_args_list = parser.parse_known_args()
-    for arg in unknown_args_list:
-        if arg.startswith(('--')):
-            # We don't know the type, so we'll just treat it as a string
-            parser.add_argument(arg.split('=')[0], type=str)
-
-    args = parser.parse_args()
-    generate_badge(args)
+    args = parse_args(sys.argv[1:])
+    if args.batch:
+        generate_batch(args)
+    elif args.badge_id and args.recipient_email:
+        generate_badge(args)
+    else:
+        usage_error("--badge_id and --recipient_email are required unless --batch is given.")
@@ -1,39 +1,64 @@
 # update_workflow.py
 import yaml
 import json
+import hashlib
+import functools
+import orjson
 import os
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
+from generate_badge import (
+    ACHIEVEMENT_OUTPUT_DIR, CONFIG_CACHE_PATH, ISSUER_OUTPUT_DIR, OB3_CONTEXT,
+    build_achievement, build_credential_template, build_issuer_profile, config_signature,
+    dump_signed_cache, load_signed_cache, resolve_templates, write_if_changed
+)
+
+# Prefer the libyaml-backed loader/dumper when PyYAML was built with it.
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 # Custom Dumper to handle multi-line strings correctly
 class LiteralString(str):
     pass
 
 def literal_presenter(dumper, data):
-    return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='|')
+    return dumper.represent_scalar('tag:yaml.org,2002:str', str(data), style='|')
 
-yaml.add_representer(LiteralString, literal_presenter)
+yaml.add_representer(LiteralString, literal_presenter, Dumper=SafeDumper)
 
 
 BADGE_CONFIG_PATH = 'badges.yml'
 WORKFLOW_PATH = '.github/workflows/generate-badge.yml'
-ISSUER_OUTPUT_DIR = 'public'
+# Records the hash of the last render's inputs and the (mtime_ns, size) of the file it wrote,
+# so no-op runs skip rendering while manual edits to the workflow are still overwritten.
+WORKFLOW_STAMP_PATH = '.github/workflows/.generate-badge.stamp.json'
+WORKFLOW_HEADER = b"# WARNING: THIS FILE IS AUTOMATICALLY GENERATED. DO NOT EDIT MANUALLY.\n"
+WORKFLOW_YAML_WIDTH = 120
+CREDENTIAL_CACHE_DIR = '.assertion-cache'
+# Shared read-only default for dict lookups; never mutate it.
+_EMPTY = {}
 
 def update_workflow_file(config):
     """Dynamically builds and completely overwrites the generate-badge.yml workflow."""
     print("\n--- Updating Generation Workflow ---")
     
-    badge_ids = list(config.get('badges', {}).keys())
     global_inputs = config.get('global_inputs', {})
     
     # --- Determine which UI inputs are needed ---
     ui_inputs = set()
+    has_expires = False
     for badge_data in config.get('badges', {}).values():
+        if badge_data.get('expires'):
+            has_expires = True
         for input_key, input_config in badge_data.get('inputs', {}).items():
             if not (isinstance(input_config, dict) and input_config.get('input') is False):
                 ui_inputs.add(input_key)
-    if any(badge.get('expires') for badge in config.get('badges', {}).values()):
+    if has_expires:
         ui_inputs.add('expires')
-    print(f"All unique UI inputs required: {sorted(list(ui_inputs))}")
+    ui_inputs = sorted(ui_inputs)
+    print(f"All unique UI inputs required: {ui_inputs}")
 
     # --- NEW: Collect only the secrets that are actually needed ---
     required_secrets = {'RECIPIENT_SALT'} # Always required
@@ -41,10 +66,11 @@ def update_workflow_file(config):
         secret_name = issuer_data.get('private_key_secret_name')
         if secret_name:
             required_secrets.add(secret_name)
-    print(f"All unique secrets required: {sorted(list(required_secrets))}")
+    required_secrets = sorted(required_secrets)
+    print(f"All unique secrets required: {required_secrets}")
 
     # --- Build the dynamic env block with only the required secrets ---
-    dynamic_env = {secret: f'${{{{ secrets.{secret} }}}}' for secret in sorted(list(required_secrets))}
+    dynamic_env = {secret: f'${{{{ secrets.{secret} }}}}' for secret in required_secrets}
 
     # --- Build the complete workflow dictionary ---
     run_script = LiteralString(
@@ -85,12 +111,12 @@ def update_workflow_file(config):
     }
     
     dynamic_inputs = {
-        'badge_id': {'description': 'Select the badge', 'required': True, 'type': 'choice', 'options': sorted(badge_ids)},
+        'badge_id': {'description': 'Select the badge', 'required': True, 'type': 'choice', 'options': sorted(config.get('badges', {}))},
         'recipient_email': {'description': "Recipient's Email", 'required': True, 'type': 'string'}
     }
     
-    for input_key in sorted(list(ui_inputs)):
-        input_config = global_inputs.get(input_key, {})
+    for input_key in ui_inputs:
+        input_config = global_inputs.get(input_key, _EMPTY)
         if input_key == 'expires':
             input_config = {'description': 'Badge expiration - YYYY-MM-DDTHH:MM:SSZ format (optional)'}
 
@@ -100,78 +126,148 @@ def update_workflow_file(config):
         }
     
     new_workflow_data['on']['workflow_dispatch']['inputs'] = dynamic_inputs
+
+    # The hash covers the rendering parameters as well as the data they are applied to.
+    render_inputs = [WORKFLOW_HEADER.decode('utf-8'), WORKFLOW_YAML_WIDTH, new_workflow_data]
+    workflow_hash = hashlib.sha256(orjson.dumps(render_inputs, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    try:
+        with open(WORKFLOW_STAMP_PATH, 'rb') as f:
+            stamp = orjson.loads(f.read())
+        st = os.stat(WORKFLOW_PATH)
+        if stamp == {'hash': workflow_hash, 'workflow': [st.st_mtime_ns, st.st_size]}:
+            print(f"{WORKFLOW_PATH} is already up to date.")
+            return
+    except (OSError, ValueError):
+        # No stamp or no workflow yet; fall through to the byte comparison.
+        pass
     
-    warning_comment = "# WARNING: THIS FILE IS AUTOMATICALLY GENERATED. DO NOT EDIT MANUALLY.\n"
+    new_workflow_bytes = WORKFLOW_HEADER + yaml.dump(
+        new_workflow_data, Dumper=SafeDumper, sort_keys=False, width=WORKFLOW_YAML_WIDTH, encoding='utf-8'
+    )
+
+    # Render in memory first and leave the file untouched if nothing would change.
+    try:
+        with open(WORKFLOW_PATH, 'rb') as f:
+            is_current = f.read() == new_workflow_bytes
+    except FileNotFoundError:
+        is_current = False
+
+    if is_current:
+        print(f"{WORKFLOW_PATH} is already up to date.")
+    else:
+        print("Rebuilding generate-badge.yml...")
+        with open(WORKFLOW_PATH, 'wb') as f:
+            f.write(new_workflow_bytes)
+        print(f"Successfully created/updated {WORKFLOW_PATH}.")
 
-    print("Rebuilding generate-badge.yml...")
-    with open(WORKFLOW_PATH, 'w') as f:
-        f.write(warning_comment)
-        yaml.dump(new_workflow_data, f, sort_keys=False, width=120)
-        
-    print(f"Successfully created/updated {WORKFLOW_PATH}.")
+    st = os.stat(WORKFLOW_PATH)
+    with open(WORKFLOW_STAMP_PATH, 'wb') as f:
+        f.write(orjson.dumps({'hash': workflow_hash, 'workflow': [st.st_mtime_ns, st.st_size]}))
 
 
+def fsync_directory(path):
+    """Flushes a directory's entries to disk where the platform supports opening directories."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
 def generate_issuer_files(config):
     """Generates public issuer JSON files from the issuers block."""
     print("\n--- Generating Issuer Files ---")
     os.makedirs(ISSUER_OUTPUT_DIR, exist_ok=True)
-    repo_url = config['repository_url']
-    
-    for issuer_id, issuer_data in config.get('issuers', {}).items():
-        filename = f"{issuer_id}-issuer.json"
-        output_path = os.path.join(ISSUER_OUTPUT_DIR, filename)
-        issuer_profile = json.loads(json.dumps(issuer_data))
-        issuer_profile['id'] = f"{repo_url}/{ISSUER_OUTPUT_DIR}/{filename}"
-        
-        for key, value in issuer_profile.items():
-            if isinstance(value, str):
-                issuer_profile[key] = value.format(repository_url=repo_url)
-        
-        issuer_profile['type'] = "Profile"
-        issuer_profile.pop('private_key_secret_name', None)
+    issuers = config.get('issuers', {})
+    output_prefix = ISSUER_OUTPUT_DIR + os.sep
 
-        with open(output_path, 'w') as f:
-            json.dump(issuer_profile, f, indent=2)
-        print(f"Generated/Updated issuer file: {output_path}")
+    def write_issuer(issuer_id):
+        output_path = f"{output_prefix}{issuer_id}-issuer.json"
+        issuer_profile = build_issuer_profile(config, issuer_id)
+        changed = write_if_changed(output_path, orjson.dumps(issuer_profile, option=orjson.OPT_INDENT_2), durable=True)
+        return output_path, changed
+
+    # The per-issuer work is mostly file I/O, so a few threads overlap the syscalls.
+    files_changed = False
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(issuers)))) as executor:
+        for output_path, changed in executor.map(write_issuer, issuers):
+            if changed:
+                print(f"Generated/Updated issuer file: {output_path}")
+                files_changed = True
+            else:
+                print(f"Issuer file is already up to date: {output_path}")
+
+    # Each file's data was synced before its rename; one directory sync then makes the renames durable.
+    if files_changed:
+        fsync_directory(ISSUER_OUTPUT_DIR)
+
+def generate_credential_templates(config, signature):
+    """
+    Caches the recipient-independent part of each badge's credential for generate_badge.py,
+    which then only fills in the id, recipient, dates and optional inputs. Each template is
+    keyed by the badges.yml signature the config was loaded with.
+    """
+    print("\n--- Generating Credential Templates ---")
+    os.makedirs(CREDENTIAL_CACHE_DIR, exist_ok=True)
+
+    for badge_id in config.get('badges', {}):
+        output_path = os.path.join(CREDENTIAL_CACHE_DIR, f"{badge_id}.json")
+        template = dump_signed_cache(BADGE_CONFIG_PATH, signature, build_credential_template(config, badge_id))
+        if write_if_changed(output_path, template):
+            print(f"Generated/Updated credential template: {output_path}")
+        else:
+            print(f"Credential template is already up to date: {output_path}")
 
 def generate_achievement_files(config):
     """Generates public Achievement JSON files from the badges block for OB 3.0."""
     print("\n--- Generating Achievement Files ---")
-    ACHIEVEMENT_OUTPUT_DIR = os.path.join(ISSUER_OUTPUT_DIR, 'badges')
     os.makedirs(ACHIEVEMENT_OUTPUT_DIR, exist_ok=True)
-    repo_url = config['repository_url']
-
-    for badge_id, badge_data in config.get('badges', {}).items():
-        filename = f"{badge_id}.json"
-        output_path = os.path.join(ACHIEVEMENT_OUTPUT_DIR, filename)
-
-        # Create the Achievement object
-        achievement_obj = {
-            '@context': [
-                "https://www.w3.org/ns/credentials/v2",
-                "https://purl.imsglobal.org/spec/ob/v3p0/context.json"
-            ],
-            'type': 'Achievement',
-            'id': f"{repo_url}/{ACHIEVEMENT_OUTPUT_DIR}/{filename}",
-            'name': badge_data['name'],
-            'description': badge_data['description'],
-            'criteria': {'narrative': badge_data['criteria']},
-            'image': {
-                'id': badge_data['image'].format(repository_url=repo_url),
-                'type': 'Image'
-            }
-        }
+
+    for badge_id in config.get('badges', {}):
+        output_path = os.path.join(ACHIEVEMENT_OUTPUT_DIR, f"{badge_id}.json")
+
+        # The published file leads with @context and type; the remaining keys follow in embedded order.
+        achievement_obj = {'@context': OB3_CONTEXT, 'type': 'Achievement', **build_achievement(config, badge_id)}
 
         with open(output_path, 'w') as f:
             json.dump(achievement_obj, f, indent=2)
         print(f"Generated/Updated Achievement file: {output_path}")
 
+@functools.lru_cache(maxsize=8)
+def _load_config_cached(path, signature):
+    """Loads and resolves a config file once per process for a given (mtime_ns, size, inode) signature."""
+    config = load_signed_cache(CONFIG_CACHE_PATH, path, list(signature))
+    if config is not None:
+        return config
+
+    # Hand libyaml one contiguous buffer instead of letting it pull small reads from a text stream.
+    with open(path, 'rb') as f:
+        raw_config = yaml.load(f.read(), Loader=SafeLoader)
+    # Substitute {repository_url} once; every generator works on the resolved config.
+    config = resolve_templates(raw_config, raw_config['repository_url'])
+    if write_if_changed(CONFIG_CACHE_PATH, dump_signed_cache(path, list(signature), config)):
+        print(f"Generated/Updated config cache: {CONFIG_CACHE_PATH}")
+    return config
+
+def load_config(path=BADGE_CONFIG_PATH, signature=None):
+    """
+    Loads badges.yml with {repository_url} resolved, reusing the in-process cache and the JSON cache
+    shared with generate_badge.py while the file's stat signature is unchanged. The returned dict is
+    shared; do not mutate it.
+    """
+    if signature is None:
+        signature = config_signature(path)
+    return _load_config_cached(path, tuple(signature))
+
 if __name__ == "__main__":
     print("--- Starting update process ---")
-    with open(BADGE_CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
+    # Load with the same signature the credential templates are keyed by.
+    signature = config_signature(BADGE_CONFIG_PATH)
+    config = load_config(BADGE_CONFIG_PATH, signature)
     
     update_workflow_file(config)
     generate_issuer_files(config)
+    generate_credential_templates(config, signature)
     generate_achievement_files(config)
     print("\n--- Update process finished ---")